@@ -7,13 +7,32 @@ Why this matters for AI agents:
 - Automatically discover solutions through iteration
 - Use test results as fitness metric (objective)
 - LLMs can be mutation/crossover operators
+
+Mutations are cached on disk across runs; set GP_MUTATION_CACHE=0 to always
+ask the LLM.
 """
 
+import ast
+import atexit
+import builtins
+import functools
+import multiprocessing
+import hashlib
+import heapq
+import io
 import json
+import os
+import shelve
+import signal
 import subprocess
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from operator import itemgetter
 from pathlib import Path
 
+from llm_client import LLMClient, extract_code
+
 # Target problem: Create a function that correctly implements fizzbuzz
 GENERATION_DIR = Path("/tmp/genetic_programming_gen")
 GENERATION_DIR.mkdir(exist_ok=True)
@@ -29,33 +48,270 @@ FITNESS_TESTS = [
     (30, "FizzBuzz"),
 ]
 
+# Loop invariants for evaluate_fitness, computed once
+_N_TESTS = len(FITNESS_TESTS)
+_TEST_ARGS = [(str(input_val), expected) for input_val, expected in FITNESS_TESTS]
+_TEST_ARGS_JSON = json.dumps(_TEST_ARGS)
+# -I (isolated) and -S (no site import) cut interpreter startup; the harness
+# and candidates only need the stdlib
+_PY = [sys.executable, "-I", "-S"]
+# Wall-clock bound per candidate. SIGALRM can't interrupt long C calls such as
+# sum(range(10**12)), so a worker stuck past this is killed; it is one second
+# beyond the harness's own timeout so that path still reports its result.
+_EVAL_TIMEOUT = _N_TESTS + 2
+
+llm = LLMClient()
+
+# Memoized results. Elites are re-evaluated every generation, and LLM calls
+# cost seconds each, so mutations are kept on disk across runs too.
+_FIT_CACHE: dict[bytes, float] = {}
+MUTATION_CACHE = GENERATION_DIR / "mut_cache"
+USE_MUTATION_CACHE = os.environ.get("GP_MUTATION_CACHE", "1") != "0"
+_mut_cache = None
+_mut_cache_lock = threading.Lock()  # Mutations run on a thread pool; shelve isn't thread-safe
+
+def _mutation_cache() -> shelve.Shelf:
+    """Open the cross-run mutation cache (prompt digest -> mutated code) on first use"""
+    global _mut_cache
+    if _mut_cache is None:
+        _mut_cache = shelve.open(str(MUTATION_CACHE))
+        atexit.register(_mut_cache.close)
+    return _mut_cache
+
+_FITNESS = itemgetter(1)  # (code, fitness) -> fitness
+
+def _digest(code: str) -> bytes:
+    return hashlib.blake2b(code.encode(), digest_size=16).digest()
+
+# Subprocess fallback for candidates that can't be run in-process: every fitness
+# test runs inside a single interpreter, the candidate compiled once and exec'd
+# per test with a patched sys.argv.
+_HARNESS = """
+import contextlib, io, json, signal, sys
+
+class _Timeout(BaseException):
+    pass
+
+timed_out = False
+
+def _alarm(signum, frame):
+    # Flag the test as failed even if the candidate catches this, and keep
+    # firing so one that catches it and loops again is still cut off
+    global timed_out
+    timed_out = True
+    signal.setitimer(signal.ITIMER_REAL, 0.1)
+    raise _Timeout()
+
+path, tests = sys.argv[1], json.loads(sys.argv[2])
+out = sys.stdout
+signal.signal(signal.SIGALRM, _alarm)
+try:
+    prog = compile(open(path).read(), path, "exec")
+except (SyntaxError, ValueError):
+    prog = None
+
+def run(arg):
+    global timed_out
+    timed_out = False
+    buf = io.StringIO()
+    sys.argv = [path, arg]
+    signal.setitimer(signal.ITIMER_REAL, 1)
+    try:
+        with contextlib.redirect_stdout(buf):
+            exec(prog, {"__name__": "__main__"})
+    except BaseException:
+        pass
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    return None if timed_out else buf.getvalue().strip()
+
+failures = 0
+for arg, expected in tests:
+    if prog is None:
+        failures += 1
+        continue
+    try:
+        actual = run(arg)
+    except _Timeout:  # Fired just as the candidate finished
+        actual = None
+    if actual != expected:
+        failures += 1
+
+out.write(f"{failures}\\n")
+"""
+
+class _Timeout(BaseException):
+    """Raised by SIGALRM; a BaseException so candidates' `except Exception` can't swallow it"""
+
+_timed_out = False  # Set by the alarm; `finally: return` can still swallow _Timeout
+
+def _raise_timeout(signum, frame):
+    global _timed_out
+    _timed_out = True
+    signal.setitimer(signal.ITIMER_REAL, 0.1)  # Keep firing until _run_test disarms it
+    raise _Timeout()
+
+# The only parts of sys a candidate run in-process may touch; anything else
+# goes to the subprocess harness so it can't alter the evaluator process
+_SANDBOX_SYS_ATTRS = frozenset({"argv", "stdout", "stderr", "exit"})
+# Builtins that reach objects or modules by name, bypassing the attribute checks
+_REFLECTIVE_BUILTINS = frozenset({
+    "getattr", "setattr", "delattr", "vars", "globals", "locals",
+    "eval", "exec", "compile", "open", "breakpoint", "input",
+})
+
+class _SandboxSys:
+    """Stand-in for `sys` inside a candidate: per-test argv, captured stdout/stderr, exit"""
+    __slots__ = ("argv", "stdout", "stderr", "exit")
+
+    def __init__(self, argv, stdout):
+        self.argv = argv
+        self.stdout = stdout
+        self.stderr = io.StringIO()
+        self.exit = sys.exit
+
+def _in_process_safe(tree: ast.AST) -> bool:
+    """Only sys.argv/stdout/stderr/exit, no reflection or dunders, and nothing that could catch _Timeout"""
+    sys_names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            if any(alias.name != "sys" for alias in node.names):
+                return False
+            sys_names.update(alias.asname or alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.module != "sys" or any(alias.name not in _SANDBOX_SYS_ATTRS for alias in node.names):
+                return False
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ExceptHandler):
+            if node.type is None or any(
+                isinstance(n, ast.Name) and n.id == "BaseException" for n in ast.walk(node.type)
+            ):
+                return False
+        elif isinstance(node, ast.Name):
+            if node.id in _REFLECTIVE_BUILTINS or (node.id.startswith("__") and node.id != "__name__"):
+                return False
+        elif isinstance(node, ast.Attribute):
+            if node.attr.startswith("__"):
+                return False
+            if (isinstance(node.value, ast.Name) and node.value.id in sys_names
+                    and node.attr not in _SANDBOX_SYS_ATTRS):
+                return False
+    return True
+
+def _run_test(prog, arg: str):
+    """Exec the compiled candidate once with argv[1] = arg; stripped stdout, or None on timeout"""
+    global _timed_out
+    _timed_out = False
+    out = io.StringIO()
+    fake_sys = _SandboxSys(["candidate", arg], out)
+    sandbox_builtins = dict(
+        vars(builtins),
+        print=functools.partial(print, file=out),
+        __import__=lambda *args, **kwargs: fake_sys,
+    )
+    signal.setitimer(signal.ITIMER_REAL, 1)
+    try:
+        exec(prog, {"__name__": "__main__", "__builtins__": sandbox_builtins})
+    except _Timeout:
+        return None
+    except BaseException:
+        pass  # Like a crashed process: whatever it printed still counts
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    return None if _timed_out else out.getvalue().strip()
+
 def evaluate_fitness(code: str) -> float:
     """
     Fitness function: How many test cases does this code pass?
     Returns: 0.0 (perfect) to 1.0 (total failure)
+
+    Candidates are compiled once and exec'd per test in this interpreter.
+    Ones that need more of sys than argv/stdout/stderr/exit, import anything
+    else, or that we can't time out (off the main thread) go through the
+    subprocess harness instead.
     """
-    test_file = GENERATION_DIR / "candidate.py"
-    test_file.write_text(code)
+    # compile() catches what parsing doesn't, e.g. `return` outside a function
+    try:
+        tree = ast.parse(code)
+        prog = compile(tree, "<candidate>", "exec")
+    except (SyntaxError, ValueError):
+        return 1.0
+    if threading.current_thread() is not threading.main_thread() or not _in_process_safe(tree):
+        return _evaluate_in_subprocess(code)
 
     failures = 0
-    for input_val, expected in FITNESS_TESTS:
-        try:
-            result = subprocess.run(
-                [sys.executable, str(test_file), str(input_val)],
-                capture_output=True,
-                text=True,
-                timeout=1
-            )
-            actual = result.stdout.strip()
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    try:
+        for arg, expected in _TEST_ARGS:
+            try:
+                actual = _run_test(prog, arg)
+            except _Timeout:  # Fired just as the candidate finished
+                actual = None
             if actual != expected:
                 failures += 1
-        except (subprocess.TimeoutExpired, Exception):
-            failures += 1
+    finally:
+        signal.signal(signal.SIGALRM, previous_handler)
+
+    return failures / _N_TESTS
+
+def _evaluate_in_subprocess(code: str) -> float:
+    # One scratch file per worker so parallel evaluations don't clobber each other
+    test_file = GENERATION_DIR / f"candidate_{os.getpid()}_{threading.get_ident()}.py"
+    test_file.write_text(code)
 
-    return failures / len(FITNESS_TESTS)
+    try:
+        result = subprocess.run(
+            [*_PY, "-c", _HARNESS, str(test_file), _TEST_ARGS_JSON],
+            capture_output=True,
+            text=True,
+            timeout=_N_TESTS + 1
+        )
+        failures = int(result.stdout.splitlines()[-1])
+    except (subprocess.TimeoutExpired, Exception):
+        failures = _N_TESTS
+    finally:
+        test_file.unlink(missing_ok=True)
 
-def llm_mutate(code: str, fitness: float) -> str:
-    """Use LLM to mutate code based on fitness"""
+    return failures / _N_TESTS
+
+def evaluate_population(
+    population: list[str], pool: ProcessPoolExecutor
+) -> tuple[list[tuple[str, float]], ProcessPoolExecutor]:
+    """
+    Pair each candidate with its fitness, evaluating only uncached ones (in parallel).
+    Candidates still running after _EVAL_TIMEOUT, or whose worker died, score 1.0;
+    the pool is then replaced, so callers must use the one returned.
+    """
+    futures = {}
+    for code in population:
+        key = _digest(code)
+        if key not in _FIT_CACHE and key not in futures:
+            futures[key] = pool.submit(evaluate_fitness, code)
+    done, not_done = wait(futures.values(), timeout=_EVAL_TIMEOUT)
+
+    recycle = bool(not_done)
+    for key, future in futures.items():
+        if future in done and future.exception() is None:
+            _FIT_CACHE[key] = future.result()
+        else:
+            _FIT_CACHE[key] = 1.0
+            recycle = True
+
+    if recycle:
+        # Executors can't cancel a running task, so kill the workers outright
+        for worker in multiprocessing.active_children():
+            worker.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+        pool = ProcessPoolExecutor(max_workers=len(population))  # One worker per candidate, as in main()
+    return [(code, _FIT_CACHE[_digest(code)]) for code in population], pool
+
+def llm_mutate(code: str, fitness: float, population: frozenset = frozenset()) -> str:
+    """
+    Use LLM to mutate code based on fitness.
+    A cached mutation is only reused if it differs from the input and from
+    every candidate in the current population; otherwise the LLM is asked again.
+    """
     prompt = f"""Here is a Python program that takes one integer argument and should implement FizzBuzz:
 - Print "Fizz" if divisible by 3
 - Print "Buzz" if divisible by 5
@@ -71,20 +327,18 @@ Current fitness (error rate): {fitness:.1%} of tests failing
 
 Output ONLY valid Python code that improves this solution. No explanations."""
 
-    result = subprocess.run(
-        ["claude", "-p", prompt],
-        capture_output=True,
-        text=True
-    )
+    key = hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+    if USE_MUTATION_CACHE:
+        with _mut_cache_lock:
+            cached = _mutation_cache().get(key)
+        if cached is not None and cached != code and cached not in population:
+            return cached
 
-    # Extract code from potential markdown blocks
-    output = result.stdout
-    if "```python" in output:
-        output = output.split("```python")[1].split("```")[0]
-    elif "```" in output:
-        output = output.split("```")[1].split("```")[0]
-
-    return output.strip()
+    mutated = extract_code(llm.ask(prompt))
+    if mutated and USE_MUTATION_CACHE:  # Don't pin a failed CLI call
+        with _mut_cache_lock:
+            _mutation_cache()[key] = mutated
+    return mutated
 
 def main():
     population_size = 3
@@ -99,39 +353,51 @@ def main():
 
     print("=== GENETIC PROGRAMMING: FizzBuzz Evolution ===\n")
 
-    for gen in range(generations):
-        print(f"Generation {gen + 1}")
-        print("-" * 60)
+    # Worker processes persist across generations (unless one has to be killed),
+    # and each evaluates candidates in its own main thread so the SIGALRM timeout works
+    pool = ProcessPoolExecutor(max_workers=population_size)
+    try:
+        for gen in range(generations):
+            print(f"Generation {gen + 1}")
+            print("-" * 60)
 
-        # Evaluate fitness
-        fitness_scores = [(code, evaluate_fitness(code)) for code in population]
-        fitness_scores.sort(key=lambda x: x[1])  # Best first
+            # Evaluate fitness (candidates are independent, so run them in parallel)
+            fitness_scores, pool = evaluate_population(population, pool)
 
-        for i, (code, fitness) in enumerate(fitness_scores):
-            status = "✓ PERFECT" if fitness == 0 else f"✗ {fitness:.0%} error"
-            print(f"  Candidate {i+1}: {status}")
+            for i, (code, fitness) in enumerate(fitness_scores):
+                status = "✓ PERFECT" if fitness == 0 else f"✗ {fitness:.0%} error"
+                print(f"  Candidate {i+1}: {status}")
 
-        best_code, best_fitness = fitness_scores[0]
+            # Partial selection: only the best one and the rest are needed, not a full sort
+            best = heapq.nsmallest(1, fitness_scores, key=_FITNESS)[0]
+            best_code, best_fitness = best
 
-        if best_fitness == 0:
-            print(f"\n🎯 Solution found in generation {gen + 1}!")
-            print("\nFinal code:")
-            print(best_code)
-            return
+            if best_fitness == 0:
+                print(f"\n🎯 Solution found in generation {gen + 1}!")
+                print("\nFinal code:")
+                print(best_code)
+                return
 
-        # Selection: Keep best, evolve worst
-        print(f"  → Evolving worst candidates via LLM mutation...")
+            # Selection: Keep best, evolve worst
+            print(f"  → Evolving worst candidates via LLM mutation...")
 
-        new_population = [best_code]  # Elitism
+            new_population = [best_code]  # Elitism
 
-        # Mutate the rest
-        for code, fitness in fitness_scores[1:]:
-            if len(new_population) < population_size:
-                mutated = llm_mutate(code, fitness)
-                new_population.append(mutated)
+            # Mutate the rest (independent LLM calls, so issue them concurrently)
+            to_mutate = heapq.nlargest(
+                population_size - 1, (entry for entry in fitness_scores if entry is not best), key=_FITNESS
+            )
+            with ThreadPoolExecutor(max_workers=max(len(to_mutate), 1)) as mutators:
+                current = frozenset(population)
+                futures = [
+                    mutators.submit(llm_mutate, code, fitness, current) for code, fitness in to_mutate
+                ]
+                new_population.extend(future.result() for future in futures)
 
-        population = new_population
-        print()
+            population = new_population
+            print()
+    finally:
+        pool.shutdown()
 
     print("Evolution complete. Best solution:")
     print(population[0])
@@ -10,80 +10,321 @@ Why this matters for AI agents:
 - Vector search for relevant past solutions
 """
 
+import atexit
 import json
-import subprocess
+import re
+import sqlite3
+import sys
 import hashlib
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 from pathlib import Path
 from typing import List, Dict, Any
 
+from llm_client import LLMClient, extract_code
+
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # Dense retrieval is optional; lexical search works without it
+    np = None
+    SentenceTransformer = None
+
+try:
+    import orjson
+except ImportError:  # Index writes fall back to stdlib json
+    orjson = None
+
+try:
+    from blake3 import blake3
+except ImportError:  # Fall back to stdlib blake2b for content hashes
+    blake3 = None
+
 SKILL_DIR = Path("/tmp/skill_library")
 SKILL_INDEX = SKILL_DIR / "index.json"
+SKILL_DB = SKILL_DIR / "skills.db"
+
+# BM25 column weights for skills_fts(id, description, tags, content)
+FTS_WEIGHTS = (0.0, 10.0, 5.0, 5.0)
+
+_WORD_RE = re.compile(r"\w+")
+
+def _tokens(text: str) -> frozenset:
+    return frozenset(_WORD_RE.findall(text.lower()))
+
+# Dense retrieval over skill descriptions, fused with BM25 by Reciprocal Rank Fusion
+SKILL_EMBEDDINGS = SKILL_DIR / "emb.npz"
+EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"
+RRF_K = 60
+RRF_WEIGHTS = {"lexical": 0.5, "semantic": 0.5}
+# Cosine floor for semantic hits; below it a skill is unrelated, not just far down the list
+EMBEDDING_MIN_SIMILARITY = 0.6
+
+def _content_hash(text: str) -> str:
+    if blake3 is not None:
+        return blake3(text.encode()).hexdigest()
+    return hashlib.blake2b(text.encode(), digest_size=32).hexdigest()
+
+llm = LLMClient()
 
 class SkillLibrary:
     def __init__(self):
         SKILL_DIR.mkdir(exist_ok=True)
-        if not SKILL_INDEX.exists():
-            SKILL_INDEX.write_text(json.dumps({"skills": []}, indent=2))
+        # Usage counts only mark the index dirty; it is written on flush(), at
+        # exit, and whenever add_skill commits a new skill
+        self._dirty = False
+        atexit.register(self.flush)
+        if SKILL_INDEX.exists():
+            self._index = json.loads(SKILL_INDEX.read_bytes())
+        else:
+            self._index = {"skills": []}
+            self._dirty = True
+            self.flush()
+
+        # Skill files are never rewritten once added, so their code can be cached
+        self._code_cache: Dict[str, str] = {}
+        self._by_id: Dict[str, Dict[str, Any]] = {skill["id"]: skill for skill in self._index["skills"]}
+        # Description token sets, aligned with self._index["skills"]
+        self._token_sets: List[frozenset] = [
+            _tokens(skill["description"]) for skill in self._index["skills"]
+        ]
+        # One connection shared by agent threads; the lock serializes its use
+        self._fts_lock = threading.Lock()
+        self._fts = self._open_fts()
+        self._encoder = None
+        self._vectors: Dict[str, Any] = {}  # content hash -> embedding
+        self._embeddings = None
+        if SentenceTransformer is not None:
+            try:
+                self._encoder = SentenceTransformer(EMBEDDING_MODEL)
+            except Exception as e:  # e.g. offline and the model isn't cached yet
+                print(f"[warn] Embedding model unavailable, using lexical search only: {e}", file=sys.stderr)
+            else:
+                self._load_embeddings()
+
+    def _open_fts(self):
+        """Open the SQLite FTS5 index, or None if this SQLite lacks FTS5"""
+        try:
+            db = sqlite3.connect(SKILL_DB, check_same_thread=False)
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS skills_fts USING fts5("
+                "id UNINDEXED, description, tags, content, tokenize='porter unicode61')"
+            )
+        except sqlite3.OperationalError:
+            return None
+
+        # Drop rows whose skill never reached index.json (e.g. a killed process),
+        # then backfill skills added before the FTS index existed and refresh
+        # rows whose description or tags were edited in index.json
+        known = {skill["id"] for skill in self._index["skills"]}
+        indexed = {row[0]: row[1:] for row in db.execute("SELECT id, description, tags FROM skills_fts")}
+        db.executemany("DELETE FROM skills_fts WHERE id = ?", [(i,) for i in indexed.keys() - known])
+        for skill in self._index["skills"]:
+            if indexed.get(skill["id"]) != (skill["description"], " ".join(skill["tags"])):
+                self._fts_upsert(db, skill, self.get_skill_code(skill["id"]) or "")
+        db.commit()
+        return db
+
+    @staticmethod
+    def _fts_upsert(db, skill: Dict[str, Any], code: str):
+        db.execute("DELETE FROM skills_fts WHERE id = ?", (skill["id"],))
+        db.execute(
+            "INSERT INTO skills_fts VALUES (?, ?, ?, ?)",
+            (skill["id"], skill["description"], " ".join(skill["tags"]), code),
+        )
+
+    def _load_embeddings(self):
+        """Reuse persisted embeddings by content hash; only new or edited descriptions get embedded"""
+        if SKILL_EMBEDDINGS.exists():
+            stored = np.load(SKILL_EMBEDDINGS)
+            if str(stored["model"]) == EMBEDDING_MODEL:
+                self._vectors = dict(zip(stored["hashes"].tolist(), stored["vectors"]))
+        self._sync_embeddings()
+
+    def _sync_embeddings(self):
+        """Embed the delta, persist vectors, and rebuild the per-skill matrix"""
+        skills = self._index["skills"]
+        hashes = [_content_hash(skill["description"]) for skill in skills]
+
+        missing = {h: skill["description"] for h, skill in zip(hashes, skills) if h not in self._vectors}
+        if missing:
+            self._vectors.update(zip(missing, self._embed(list(missing.values()))))
+
+        live = set(hashes)
+        if missing or len(live) != len(self._vectors):
+            self._vectors = {h: v for h, v in self._vectors.items() if h in live}
+            np.savez(
+                SKILL_EMBEDDINGS,
+                model=np.array(EMBEDDING_MODEL),
+                hashes=np.array(list(self._vectors)),
+                vectors=self._embed([]) if not self._vectors else np.stack(list(self._vectors.values())),
+            )
+
+        stale = False
+        for skill, h in zip(skills, hashes):
+            if skill.get("content_hash") != h or skill.get("embedding_model") != EMBEDDING_MODEL:
+                skill["content_hash"] = h
+                skill["embedding_model"] = EMBEDDING_MODEL
+                stale = True
+        if stale:
+            self._dirty = True
+
+        self._embeddings = np.stack([self._vectors[h] for h in hashes]) if hashes else self._embed([])
+
+    def _embed(self, texts: List[str]):
+        """Unit-normalized embeddings, so a dot product is cosine similarity"""
+        if not texts:
+            return np.zeros((0, self._encoder.get_sentence_embedding_dimension()), dtype=np.float32)
+        return self._encoder.encode(texts, normalize_embeddings=True).astype(np.float32)
+
+    def flush(self):
+        """Write the in-memory index back to disk atomically, if it changed"""
+        if not self._dirty:
+            return
+        if orjson is not None:
+            data = orjson.dumps(self._index, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)
+        else:  # Same bytes as orjson: raw UTF-8, trailing newline
+            data = (json.dumps(self._index, indent=2, ensure_ascii=False) + "\n").encode()
+        tmp = SKILL_INDEX.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(SKILL_INDEX)
+        self._dirty = False
 
     def add_skill(self, description: str, code: str, tags: List[str] = None):
-        """Store a new skill"""
-        skill_id = hashlib.md5(description.encode()).hexdigest()[:8]
-        skill_file = SKILL_DIR / f"skill_{skill_id}.py"
+        """Store a new skill (re-adding an unchanged skill is a no-op)"""
+        content_hash = _content_hash(description)
+        tags = tags or []
+
+        # Match on the description, not the derived ID: entries stored under an
+        # older ID scheme (MD5) keep their ID and file instead of being duplicated
+        existing = next((s for s in self._index["skills"] if s["description"] == description), None)
+        if existing is not None:
+            skill_id = existing["id"]
+            skill_file = Path(existing["file"])
+        else:
+            skill_id = hashlib.blake2b(description.encode(), digest_size=4).hexdigest()
+            skill_file = SKILL_DIR / f"skill_{skill_id}.py"
+
+        if (existing is not None and existing.get("content_hash") == content_hash
+                and existing["tags"] == tags and self.get_skill_code(skill_id) == code):
+            print(f"✓ Skill unchanged: {skill_id} - {description}")
+            return skill_id
 
         skill_file.write_text(code)
+        self._code_cache[skill_id] = code
 
         # Update index
-        index = json.loads(SKILL_INDEX.read_text())
-        index["skills"].append({
-            "id": skill_id,
-            "description": description,
-            "file": str(skill_file),
-            "tags": tags or [],
-            "uses": 0
-        })
-        SKILL_INDEX.write_text(json.dumps(index, indent=2))
+        if existing is None:
+            skill = {
+                "id": skill_id,
+                "description": description,
+                "file": str(skill_file),
+                "tags": tags,
+                "uses": 0,
+                "content_hash": content_hash
+            }
+            self._index["skills"].append(skill)
+            self._by_id[skill_id] = skill
+            self._token_sets.append(_tokens(description))
+        else:
+            skill = existing
+            skill["tags"] = tags
+            skill["content_hash"] = content_hash
+        # Written before the FTS commit so skills.db never holds IDs index.json lacks
+        self._dirty = True
+        self.flush()
+
+        if self._fts is not None:
+            with self._fts_lock:
+                self._fts_upsert(self._fts, skill, code)
+                self._fts.commit()
+
+        if self._encoder is not None:
+            self._sync_embeddings()
 
         print(f"✓ Skill added: {skill_id} - {description}")
         return skill_id
 
     def search_skills(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """Find relevant skills (simple keyword matching, could use embeddings)"""
-        index = json.loads(SKILL_INDEX.read_text())
-
+        """Find relevant skills (lexical + embedding hybrid when an encoder is available)"""
+        lexical = self._lexical_search(query, limit)
+        if self._embeddings is None or not len(self._embeddings):
+            return lexical
+
+        skills = self._index["skills"]
+        similarities = self._embeddings @ self._embed([query])[0]
+        semantic = [
+            skills[i] for i in np.argsort(-similarities)[:limit]
+            if similarities[i] >= EMBEDDING_MIN_SIMILARITY
+        ]
+
+        # Reciprocal Rank Fusion: score = sum(w / (k + rank)) over both rankings
+        scores = defaultdict(float)
+        by_id = {}
+        for source, ranked in (("lexical", lexical), ("semantic", semantic)):
+            for rank, skill in enumerate(ranked, start=1):
+                scores[skill["id"]] += RRF_WEIGHTS[source] / (RRF_K + rank)
+                by_id[skill["id"]] = skill
+
+        fused = sorted(scores, key=scores.get, reverse=True)
+        return [by_id[skill_id] for skill_id in fused[:limit]]
+
+    def _lexical_search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """BM25 over FTS5, keyword matching as fallback"""
+        if self._fts is None:
+            return self._keyword_search(query, limit)
+
+        # Quote each token so FTS5 query syntax in the task text is taken literally
+        terms = _WORD_RE.findall(query.lower())
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+
+        with self._fts_lock:
+            rows = self._fts.execute(
+                "SELECT id FROM skills_fts WHERE skills_fts MATCH ? "
+                f"ORDER BY bm25(skills_fts, {', '.join(map(str, FTS_WEIGHTS))}) LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        return [self._by_id[skill_id] for (skill_id,) in rows if skill_id in self._by_id]
+
+    def _keyword_search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """Simple keyword matching for when FTS5 is unavailable"""
         # Simple relevance: count matching words
-        query_words = set(query.lower().split())
-
-        scored_skills = []
-        for skill in index["skills"]:
-            desc_words = set(skill["description"].lower().split())
-            score = len(query_words & desc_words)
-            if score > 0:
-                scored_skills.append((score, skill))
-
-        scored_skills.sort(reverse=True, key=lambda x: x[0])
+        query_words = _tokens(query)
+
+        scored_skills = [
+            (len(query_words & words), skill)
+            for words, skill in zip(self._token_sets, self._index["skills"])
+        ]
+        scored_skills = [entry for entry in scored_skills if entry[0] > 0]
+        scored_skills.sort(reverse=True, key=itemgetter(0))
         return [skill for _, skill in scored_skills[:limit]]
 
     def get_skill_code(self, skill_id: str) -> str:
         """Retrieve skill code"""
-        index = json.loads(SKILL_INDEX.read_text())
-        for skill in index["skills"]:
-            if skill["id"] == skill_id:
-                return Path(skill["file"]).read_text()
-        return None
+        if skill_id in self._code_cache:
+            return self._code_cache[skill_id]
+        skill = self._by_id.get(skill_id)
+        if skill is None:
+            return None
+        code = Path(skill["file"]).read_text()
+        self._code_cache[skill_id] = code
+        return code
 
     def increment_usage(self, skill_id: str):
         """Track skill usage"""
-        index = json.loads(SKILL_INDEX.read_text())
-        for skill in index["skills"]:
-            if skill["id"] == skill_id:
-                skill["uses"] += 1
-        SKILL_INDEX.write_text(json.dumps(index, indent=2))
+        if skill_id in self._by_id:
+            self._by_id[skill_id]["uses"] += 1
+        self._dirty = True
 
     def list_skills(self):
         """Show all skills"""
-        index = json.loads(SKILL_INDEX.read_text())
-        print(f"\n=== Skill Library ({len(index['skills'])} skills) ===")
-        for skill in index["skills"]:
+        skills = self._index["skills"]
+        print(f"\n=== Skill Library ({len(skills)} skills) ===")
+        for skill in skills:
             print(f"  [{skill['id']}] {skill['description']}")
             print(f"     Tags: {', '.join(skill['tags'])} | Uses: {skill['uses']}")
 
@@ -91,20 +332,21 @@ class SkillLibrary:
 def agent_solve_task(task: str, library: SkillLibrary) -> str:
     """Agent attempts to solve task using skill library + LLM"""
 
-    print(f"\n🎯 Task: {task}")
+    # Report is printed in one go at the end, so concurrent tasks don't interleave
+    report = ["=" * 60, f"\n🎯 Task: {task}"]
 
     # Search for relevant skills
     relevant_skills = library.search_skills(task)
 
     if relevant_skills:
-        print(f"\n📚 Found {len(relevant_skills)} relevant skills:")
+        report.append(f"\n📚 Found {len(relevant_skills)} relevant skills:")
         context = "You have access to these previously written skills:\n\n"
         for skill in relevant_skills:
             code = library.get_skill_code(skill["id"])
             context += f"# {skill['description']}\n```python\n{code}\n```\n\n"
-            print(f"  - {skill['description']}")
+            report.append(f"  - {skill['description']}")
     else:
-        print("\n📚 No relevant skills found. Starting from scratch.")
+        report.append("\n📚 No relevant skills found. Starting from scratch.")
         context = ""
 
     # Ask LLM to solve (potentially using/composing existing skills)
@@ -114,22 +356,11 @@ Task: {task}
 Write a Python function that solves this task. If you can use or compose the existing skills above, do so.
 Output ONLY the Python code, nothing else."""
 
-    result = subprocess.run(
-        ["claude", "-p", prompt],
-        capture_output=True,
-        text=True
-    )
-
-    code = result.stdout.strip()
-
-    # Extract from markdown if present
-    if "```python" in code:
-        code = code.split("```python")[1].split("```")[0].strip()
-    elif "```" in code:
-        code = code.split("```")[1].split("```")[0].strip()
+    code = extract_code(llm.ask(prompt))
 
-    print("\n💻 Generated solution:")
-    print(code)
+    report.append("\n💻 Generated solution:")
+    report.append(code)
+    print("\n" + "\n".join(report))
 
     # Optionally: Test the code, and if successful, add to library
     return code
@@ -143,24 +374,19 @@ def demo_workflow():
     print("=== SKILL LIBRARY DEMO ===")
     print("Agent will solve tasks and build reusable skills over time.\n")
 
-    # Task 1: Basic skill
-    print("\n" + "="*60)
+    # Tasks 1 and 2: Independent basic skills, solved concurrently
     task1 = "read a JSON file and return its contents as a dict"
-    code1 = agent_solve_task(task1, library)
-
-    print("\n💾 Adding to skill library...")
-    library.add_skill(task1, code1, tags=["json", "file", "io"])
-
-    # Task 2: Another basic skill
-    print("\n" + "="*60)
     task2 = "calculate the average of a list of numbers"
-    code2 = agent_solve_task(task2, library)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        future1 = pool.submit(agent_solve_task, task1, library)
+        future2 = pool.submit(agent_solve_task, task2, library)
+        code1, code2 = future1.result(), future2.result()
 
     print("\n💾 Adding to skill library...")
+    library.add_skill(task1, code1, tags=["json", "file", "io"])
     library.add_skill(task2, code2, tags=["math", "statistics"])
 
     # Task 3: Composite task (should find and use previous skills)
-    print("\n" + "="*60)
     task3 = "read a JSON file containing a list of numbers and calculate their average"
     code3 = agent_solve_task(task3, library)
 
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Shared LLM access for the self-modifying patterns.
+
+By default every prompt is one `claude -p` call, as the patterns did originally.
+
+Environment:
+    LLM_BACKEND=api   Opt in to the Anthropic SDK (billed API calls; needs the
+                      `anthropic` package and ANTHROPIC_API_KEY). One client
+                      keeps a keep-alive HTTPS pool, so repeated prompts skip
+                      process startup, auth and TLS setup.
+    ANTHROPIC_MODEL   Model for the API backend (default: claude-sonnet-4-5).
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+try:
+    import anthropic
+except ImportError:  # The CLI fallback needs nothing beyond the claude binary
+    anthropic = None
+
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "cli")
+DEFAULT_MODEL = os.environ.get("ANTHROPIC_MODEL", "claude-sonnet-4-5")
+MAX_TOKENS = 4096
+
+# Prefer a ```python block; otherwise take the first fenced block of any language.
+# The newline after the tag and the closing fence are optional, so one-line
+# blocks and replies truncated mid-block still yield their code.
+_PYTHON_BLOCK_RE = re.compile(r"```python\b[ \t]*\n?(.*?)(?:```|\Z)", re.DOTALL)
+_ANY_BLOCK_RE = re.compile(r"```(?:[\w+-]*[ \t]*\n)?(.*?)(?:```|\Z)", re.DOTALL)
+
+
+def extract_code(output: str) -> str:
+    """Pull code out of a markdown-fenced LLM reply (or return the reply as-is)"""
+    match = _PYTHON_BLOCK_RE.search(output) or _ANY_BLOCK_RE.search(output)
+    return (match.group(1) if match else output).strip()
+
+
+class LLMClient:
+    def __init__(self, model: str = DEFAULT_MODEL):
+        self.model = model
+        self._api = None
+        if LLM_BACKEND == "api":
+            if anthropic is None or not os.environ.get("ANTHROPIC_API_KEY"):
+                print(
+                    "[warn] LLM_BACKEND=api needs the anthropic package and ANTHROPIC_API_KEY; "
+                    "using the claude CLI",
+                    file=sys.stderr,
+                )
+            else:
+                self._api = anthropic.Anthropic()
+
+    def ask(self, prompt: str) -> str:
+        """Send one independent prompt and return the text reply (safe to call from threads)"""
+        if self._api is not None:
+            try:
+                message = self._api.messages.create(
+                    model=self.model,
+                    max_tokens=MAX_TOKENS,
+                    messages=[{"role": "user", "content": prompt}],
+                )
+            except anthropic.APIError as e:
+                # Same as a failed `claude -p`: empty output, callers carry on
+                print(f"[warn] Anthropic API call failed: {e}", file=sys.stderr)
+                return ""
+            return "".join(block.text for block in message.content if block.type == "text")
+
+        result = subprocess.run(
+            ["claude", "-p", prompt],
+            capture_output=True,
+            text=True
+        )
+        return result.stdout
@@ -10,21 +10,40 @@ import argparse
 import json
 import sys
 from collections import Counter, defaultdict
+from itertools import combinations
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; stdlib json also accepts bytes
+    orjson = None
+
+
+def _loads(line: bytes):
+    # orjson rejects NaN, Infinity and integers wider than 64 bits, which
+    # stdlib json accepts; retry those lines so output doesn't depend on orjson
+    if orjson is not None:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(line)
+
 
 def load_anomalies(path: Path):
     anomalies = []
-    with path.open("r", encoding="utf-8") as f:
+    # Binary mode: the parser decodes UTF-8 itself, so skip the text-layer decode
+    with path.open("rb") as f:
         for lineno, line in enumerate(f, start=1):
             line = line.strip()
             if not line:
                 continue
             try:
-                anomalies.append(json.loads(line))
-            except json.JSONDecodeError:
+                anomalies.append(_loads(line))
+            except ValueError:  # JSONDecodeError (stdlib and orjson) or bad UTF-8
                 print(
-                    f"[warn] Skipping bad JSON on line {lineno}: {line[:80]!r}",
+                    f"[warn] Skipping bad JSON on line {lineno}: "
+                    f"{line[:80].decode('utf-8', 'replace')!r}",
                     file=sys.stderr,
                 )
     return anomalies
@@ -56,69 +75,83 @@ def main():
         print("No anomalies found in file.")
         return
 
-    # 1) Counts per experiment name
-    by_name = Counter(a.get("name", "<unknown>") for a in anomalies)
+    # Columnar layout: one pass pulls the fields out, zip(*) transposes them,
+    # and Counter's C counting loop does the grouping:
+    #   1)  counts per experiment name
+    #   2a) anomalies per iterator
+    #   2b) sets of actual outputs per (experiment name, iterator)
+    #   3)  anomaly patterns: (name, expected, actual)
+    rows = [
+        (a.get("name", "<unknown>"), a.get("iterator", -1), a.get("expected", ""), a.get("actual", ""))
+        for a in anomalies
+    ]
+    name_col, iter_col, expected_col, actual_col = zip(*rows)
 
-    # 2a) Simple: anomalies per iterator
-    by_iter = Counter(a.get("iterator", -1) for a in anomalies)
+    by_name = Counter(name_col)
+    by_iter = Counter(iter_col)
+    pattern_counts = Counter(zip(name_col, expected_col, actual_col))
 
-    # 2b) Pairwise iterator disagreement per experiment name
-    #     For each experiment name, compare sets of actual outputs per iterator.
+    # Distinct (name, iterator, actual) triples only, in first-seen order
     name_iter_actuals = defaultdict(lambda: defaultdict(set))
-    for a in anomalies:
-        name = a.get("name", "<unknown>")
-        it = a.get("iterator", -1)
-        actual = a.get("actual", "")
+    for name, it, actual in dict.fromkeys(zip(name_col, iter_col, actual_col)):
         name_iter_actuals[name][it].add(actual)
 
+    # 2b) Pairwise iterator disagreement per experiment name
+    #     For each experiment name, compare sets of actual outputs per iterator.
+    #     Iterators are bucketed by their frozenset of actuals; only pairs drawn
+    #     from different buckets disagree, so no set comparisons are needed.
+    #     Pairs are sorted per experiment to keep the original (i, j) order.
     pair_disagreements = Counter()
-    for _, iter_map in name_iter_actuals.items():
-        iters = sorted(iter_map.keys())
-        for i_idx in range(len(iters)):
-            for j_idx in range(i_idx + 1, len(iters)):
-                i = iters[i_idx]
-                j = iters[j_idx]
-                if iter_map[i] != iter_map[j]:
-                    pair_disagreements[(i, j)] += 1
-
-    # 3) Top anomaly patterns: (name, expected, actual)
-    pattern_counts = Counter(
-        (a.get("name", "<unknown>"), a.get("expected", ""), a.get("actual", ""))
-        for a in anomalies
-    )
+    for iter_map in name_iter_actuals.values():
+        buckets = defaultdict(list)
+        for it, actuals in iter_map.items():
+            buckets[frozenset(actuals)].append(it)
+        if len(buckets) < 2:
+            continue
+        pair_disagreements.update(sorted(
+            (i, j) if i < j else (j, i)
+            for members_a, members_b in combinations(buckets.values(), 2)
+            for i in members_a
+            for j in members_b
+        ))
 
     # ---- Output ----
-    print(f"Loaded {len(anomalies)} anomalies from {path}")
-    print()
+    # Collected and written once: one large write instead of one per line
+    out = []
+    emit = out.append
+    emit(f"Loaded {len(anomalies)} anomalies from {path}")
+    emit("")
 
     # 1) Counts per experiment name
-    print("=== Top experiments by anomaly count ===")
+    emit("=== Top experiments by anomaly count ===")
     for name, count in by_name.most_common(args.top):
-        print(f"{count:4d}  {name}")
-    print()
+        emit(f"{count:4d}  {name}")
+    emit("")
 
     # 2a) Anomalies per iterator
-    print("=== Anomalies per iterator ===")
+    emit("=== Anomalies per iterator ===")
     for it, count in sorted(by_iter.items(), key=lambda x: x[0]):
         label = f"iterator {it}" if it != -1 else "iterator <missing>"
-        print(f"{label:15s} {count:4d}")
-    print()
+        emit(f"{label:15s} {count:4d}")
+    emit("")
 
     # 2b) Iterator pairs that disagree the most
-    print("=== Iterator pairs with most disagreements (by experiment name) ===")
+    emit("=== Iterator pairs with most disagreements (by experiment name) ===")
     if pair_disagreements:
         for (i, j), count in pair_disagreements.most_common(args.top):
-            print(f"iter {i:2d} vs {j:2d} : {count} experiments")
+            emit(f"iter {i:2d} vs {j:2d} : {count} experiments")
     else:
-        print("No iterator pairs with conflicting actual outputs detected.")
-    print()
+        emit("No iterator pairs with conflicting actual outputs detected.")
+    emit("")
 
     # 3) Top anomaly patterns
-    print("=== Top anomaly patterns (name | expected -> actual) ===")
+    emit("=== Top anomaly patterns (name | expected -> actual) ===")
     for (name, expected, actual), count in pattern_counts.most_common(args.top):
-        print(f"\n[{count}x] {name}")
-        print(f"  expected: {expected!r}")
-        print(f"  actual  : {actual!r}")
+        emit(f"\n[{count}x] {name}")
+        emit(f"  expected: {expected!r}")
+        emit(f"  actual  : {actual!r}")
+
+    sys.stdout.write("\n".join(out) + "\n")
 
 
 if __name__ == "__main__":